@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Main file
+"""
+
+import io
+import sys
+import time
+
+get_logger = __import__('filtered_logger').get_logger
+
+records = 10000
+message = "name=Bob;email=bob@dylan.com;ssn=000-123-0000;password=bobby2019;"
+
+stream = io.StringIO()
+sys.stderr = stream
+calls = 0
+for target in (1, 10, 100, 1000):
+    while calls < target:
+        logger = get_logger()
+        calls += 1
+    stream.seek(0)
+    stream.truncate()
+    start = time.perf_counter()
+    for _ in range(records):
+        logger.info(message)
+    elapsed = time.perf_counter() - start
+    lines = stream.getvalue().count("\n")
+    print("{} get_logger() calls: {} handler(s), {} line(s) and {:.1f}us "
+          "per record".format(calls, len(logger.handlers), lines // records,
+                              elapsed * 1e6 / records))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Main file
+"""
+
+import time
+
+Redactor = __import__('filtered_logger').Redactor
+PII_FIELDS = __import__('filtered_logger').PII_FIELDS
+
+records = 2000
+message = "".join("key_{0}=value_{0};field_{0}=secret_{0};".format(i)
+                  for i in range(0, 40, 4))
+message += "name=Bob;email=bob@dylan.com;ssn=000-123-0000;password=bobby2019;"
+
+for count in (5, 10, 50, 100, 200, 500, 1000):
+    fields = PII_FIELDS + tuple("field_{}".format(i)
+                                for i in range(count - len(PII_FIELDS)))
+    timings = {}
+    outputs = set()
+    for matcher in ("regex", "tokens"):
+        redactor = Redactor(fields, "***", ";", matcher)
+        start = time.perf_counter()
+        for _ in range(records):
+            redacted = redactor.redact(message)
+        timings[matcher] = (time.perf_counter() - start) * 1e6 / records
+        outputs.add(redacted)
+    print("{:4} fields: regex {:7.1f}us, tokens {:5.1f}us, same output: {}"
+          .format(count, timings["regex"], timings["tokens"],
+                  len(outputs) == 1))
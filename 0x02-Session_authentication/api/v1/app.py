@@ -11,7 +11,8 @@ import os
 
 app = Flask(__name__)
 app.register_blueprint(app_views)
-CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
+CORS(app, resources={r"/api/v1/*": {"origins": "*"}},
+     expose_headers=["ETag", "X-Next-Cursor"])
 
 auth = None
 AUTH_TYPE = getenv("AUTH_TYPE")
@@ -2,18 +2,110 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request, stream_with_context
+from models.base import PAGE_CHUNK, join_json
 from models.user import User
+from os import getenv
+from typing import FrozenSet, Iterator, Optional
+
+
+MAX_PAGE_SIZE = int(getenv("API_MAX_PAGE_SIZE", 1000))
+
+
+def json_response(text: str, status: int = 200) -> Response:
+    """ Response sending a JSON text as `jsonify` would
+    """
+    return Response(text + "\n", status, mimetype="application/json")
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """ 304 response if the client already has the representation tagged
+    `etag`, as told by If-None-Match, None otherwise
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def requested_fields() -> Optional[FrozenSet[str]]:
+    """ Attribute names of the comma-separated `fields` query parameter
+    Return:
+      - None if the parameter is missing or lists no name
+    """
+    fields = request.args.get('fields')
+    if fields is None:
+        return None
+    fields = frozenset(name.strip() for name in fields.split(","))
+    fields -= {""}
+    return fields or None
+
+
+def stream_users(cursor: Optional[str] = None,
+                 fields: Optional[FrozenSet[str]] = None) -> Iterator[str]:
+    """ Stream the JSON list of the users, in ID order, PAGE_CHUNK users
+    at a time, in the format of `jsonify`
+    """
+    separator = "["
+    while True:
+        users = User.all(PAGE_CHUNK, cursor)
+        if users:
+            yield separator + join_json(users, fields)
+            separator = ","
+        if len(users) < PAGE_CHUNK:
+            break
+        cursor = users[-1].id
+    yield "[]\n" if separator == "[" else "]\n"
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters:
+      - limit (optional): number of users per page, at most
+        MAX_PAGE_SIZE (API_MAX_PAGE_SIZE, 1000 by default)
+      - cursor (optional): ID of the last user of the previous page
+      - fields (optional): comma-separated attributes to return, all of
+        them by default
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, in ID order, streamed
+        without `limit`
+      - with `limit`, one page of them and, if there are more, the cursor
+        of the next page in the X-Next-Cursor header
+      - 400 if limit isn't a positive integer up to MAX_PAGE_SIZE
+      - 304 if the ETag given in If-None-Match is still current: it
+        names the stored users, so every worker serving the same files
+        gives the same one, across restarts. While saves or removals are
+        waiting to be written (batched or shutdown durability), it is
+        specific to the worker until they are.
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit')
+    fields = requested_fields()
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0 or limit > MAX_PAGE_SIZE:
+            return jsonify({'error': "limit must be a positive integer up "
+                                     "to {}".format(MAX_PAGE_SIZE)}), 400
+    etag = User.version()
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    if limit is None:
+        users = stream_with_context(stream_users(cursor, fields))
+        response = Response(users, mimetype="application/json")
+    else:
+        users = User.all(limit + 1, cursor)
+        response = json_response("[{}]".format(join_json(users[:limit],
+                                                         fields)))
+        if len(users) > limit:
+            response.headers['X-Next-Cursor'] = users[limit - 1].id
+    response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -21,23 +113,38 @@ def view_one_user(user_id: str = None) -> str:
     """ GET /api/v1/users/:id
     Path parameter:
       - User ID
+    Query parameter:
+      - fields (optional): comma-separated attributes to return, all of
+        them by default
     Return:
       - User object JSON represented
       - 404 if the User ID doesn't exist
+      - 304 if the ETag given in If-None-Match is still current: it is
+        a hash of the JSON of the user, the same on every worker
     """
     if user_id is None:
         abort(404)
 
+    user = None
     if user_id == 'me':
-        if request.current_user is None:
+        user = request.current_user
+        if user is None:
             abort(404)
-        else:
-            return jsonify(request.current_user.to_json())
+        user_id = user.id
 
-    user = User.get(user_id)
+    etag = User.revision(user_id)
+    if etag is not None:
+        response = not_modified(etag)
+        if response is not None:
+            return response
+    if user is None:
+        user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    response = json_response(user.to_json_text(requested_fields()))
+    if etag is not None:
+        response.set_etag(etag)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -90,7 +197,7 @@ def create_user() -> str:
             user.first_name = rj.get("first_name")
             user.last_name = rj.get("last_name")
             user.save()
-            return jsonify(user.to_json()), 201
+            return json_response(user.to_json_text(), 201)
         except Exception as e:
             error_msg = "Can't create User: {}".format(e)
     return jsonify({'error': error_msg}), 400
@@ -126,4 +233,4 @@ def update_user(user_id: str = None) -> str:
     if rj.get('last_name') is not None:
         user.last_name = rj.get('last_name')
     user.save()
-    return jsonify(user.to_json()), 200
+    return json_response(user.to_json_text())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+""" Main 1
+Stress test of the models store: threads save, search, query and remove
+users concurrently, in every storage mode and durability, then check that
+memory and the files on disk hold exactly the users left alive.
+
+Usage: ./main_1.py [threads] [iterations]
+"""
+import os
+import sys
+import tempfile
+import threading
+import traceback
+from models.user import User
+
+threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+
+""" Work in a scratch directory, not on the .db_* files of this one """
+os.chdir(tempfile.mkdtemp())
+
+
+def work(n, created, removed, errors):
+    """ Save, search, query and remove users of thread `n` """
+    try:
+        for i in range(iterations):
+            email = "t{}-{}@hbtn.io".format(n, i)
+            user = User(email=email)
+            user.save()
+            created.add(user.id)
+            found = User.search({"email": email})
+            assert [u.id for u in found] == [user.id], found
+            User.all()
+            User.query({"email__prefix": "t{}-".format(n)})
+            User.count()
+            if i % 3 == 0:
+                user.remove()
+                removed.add(user.id)
+    except Exception as e:
+        traceback.print_exc()
+        errors.append(e)
+
+
+for storage_mode in ("snapshot", "journal", "sharded"):
+    for durability in ("immediate", "batched", "shutdown"):
+        for file_name in os.listdir("."):
+            os.remove(file_name)
+        User.storage_mode = storage_mode
+        User.durability = durability
+        User.load_from_file()
+
+        created = [set() for _ in range(threads)]
+        removed = [set() for _ in range(threads)]
+        errors = []
+        workers = [threading.Thread(target=work,
+                                    args=(n, created[n], removed[n], errors))
+                   for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        alive = set().union(*created) - set().union(*removed)
+        kept = iterations - (iterations + 2) // 3
+
+        assert not errors, errors
+        assert {u.id for u in User.all()} == alive, "users in memory"
+        User.flush()
+        User.load_from_file()
+        assert {u.id for u in User.all()} == alive, "users on disk"
+        assert len(User.query({"email__prefix": "t0-"})) == kept
+        print("{} / {}: {} users OK".format(storage_mode, durability,
+                                            len(alive)))
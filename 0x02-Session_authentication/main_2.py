@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+""" Main 2
+Startup benchmark: time and peak memory of loading a store of users
+  - "plain": `json.load` and `User(**value)` for every entry, as
+    `load_from_file` used to
+  - "eager": `load_from_file`
+  - "lazy": `load_from_file` with `lazy_load`
+The first search by email after `load_from_file` is timed too.
+Each mode runs in its own process, on the same file, once for the time
+and once for the peak memory.
+
+Usage: ./main_2.py [users]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+
+def generate(users):
+    """ Write a .db_User.json file of `users` users """
+    objs = {}
+    for i in range(users):
+        user_id = str(uuid.uuid4())
+        objs[user_id] = {
+            "id": user_id,
+            "created_at": "2024-01-01T00:00:00",
+            "updated_at": "2024-01-02T00:00:00",
+            "email": "user{}@hbtn.io".format(i),
+            "_password": "a" * 64,
+            "first_name": None,
+            "last_name": None,
+        }
+    with open(".db_User.json", "w") as f:
+        json.dump(objs, f)
+
+
+def measure(mode, memory):
+    """ Load the store in `mode` and print the time it took, or the peak
+    memory it used with `memory`: tracing allocations slows loading down
+    too much to time it at the same time
+    """
+    from models.user import User
+
+    User.lazy_load = mode == "lazy"
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "plain":
+        with open(".db_User.json") as f:
+            objs = json.load(f)
+        users = {key: User(**value) for key, value in objs.items()}
+    else:
+        User.load_from_file()
+    elapsed = time.perf_counter() - start
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        print("{:>5}: peak {:.0f}MB".format(mode, peak / 1e6), flush=True)
+        return
+    line = "{:>5}: {:.2f}s".format(mode, elapsed)
+    if mode != "plain":
+        start = time.perf_counter()
+        User.search({"email": "user1@hbtn.io"})
+        line += ", first search {:.2f}s".format(time.perf_counter() - start)
+    print(line, flush=True)
+
+
+if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+    os.chdir(sys.argv[4])
+    measure(sys.argv[2], sys.argv[3] == "memory")
+else:
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    here = os.path.dirname(os.path.abspath(__file__))
+    """ Work in a scratch directory, not on the .db_* files of this one """
+    scratch = tempfile.mkdtemp()
+    os.chdir(scratch)
+    generate(users)
+    print("{} users, {:.0f}MB of JSON".format(
+        users, os.path.getsize(".db_User.json") / 1e6))
+    for what in ("time", "memory"):
+        for mode in ("plain", "eager", "lazy"):
+            subprocess.run([sys.executable, os.path.abspath(__file__),
+                            "--measure", mode, what, scratch],
+                           check=True, cwd=here)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+""" Main 3
+Memory benchmark of the compact mode: memory taken by the users of a
+store, measured with tracemalloc, with the regular `__dict__` instances
+and with MODELS_COMPACT=1. MODELS_COMPACT is read at import time, so each
+mode runs in its own process. The strings of the JSON are built before
+tracing starts, so only what the objects add to them is counted.
+
+Usage: ./main_3.py [users]
+"""
+import gc
+import os
+import subprocess
+import sys
+import tracemalloc
+import uuid
+
+
+def measure(users):
+    """ Print the memory taken by `users` users built from their JSON """
+    from models.user import User
+
+    objs = [{
+        "id": str(uuid.uuid4()),
+        "created_at": "2024-01-01T00:00:00",
+        "updated_at": "2024-01-02T00:00:00",
+        "email": "user{}@hbtn.io".format(i),
+        "_password": "a" * 64,
+        "first_name": None,
+        "last_name": None,
+    } for i in range(users)]
+    gc.collect()
+    tracemalloc.start()
+    store = {}
+    for obj_json in objs:
+        store[obj_json["id"]] = User(**obj_json)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    mode = "compact" if os.environ["MODELS_COMPACT"] == "1" else "regular"
+    print("{:>7}: {:.0f}MB, {:.0f} bytes per user".format(
+        mode, size / 1e6, size / users), flush=True)
+
+
+if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+    measure(int(sys.argv[2]))
+else:
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print("{} users".format(users), flush=True)
+    for compact in ("0", "1"):
+        env = dict(os.environ, MODELS_COMPACT=compact)
+        subprocess.run([sys.executable, os.path.abspath(__file__),
+                        "--measure", str(users)], check=True, env=env,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
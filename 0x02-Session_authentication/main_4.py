@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+""" Main 4
+Snapshot format benchmark: time to save and load a store of users, and
+size of its file, in the "json" and "binary" snapshot formats. Times are
+the best of 3 runs.
+
+Usage: ./main_4.py [users]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from models.user import User
+
+
+def best(function, runs=3):
+    """ Shortest time taken by `function` over `runs` calls """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+users = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+""" Work in a scratch directory, not on the .db_* files of this one """
+os.chdir(tempfile.mkdtemp())
+objs = {}
+for i in range(users):
+    user_id = str(uuid.uuid4())
+    objs[user_id] = {
+        "id": user_id,
+        "created_at": "2024-01-01T00:00:00",
+        "updated_at": "2024-01-02T00:00:00",
+        "email": "user{}@hbtn.io".format(i),
+        "_password": "a" * 64,
+        "first_name": None,
+        "last_name": None,
+    }
+with open(".db_User.json", "w") as f:
+    json.dump(objs, f)
+del objs
+User.load_from_file()
+
+print("{} users".format(users))
+for snapshot_format in ("json", "binary"):
+    User.snapshot_format = snapshot_format
+    save = best(User.save_to_file)
+    size = os.path.getsize(".db_User.json")
+    load = best(User.load_from_file)
+    print("{:>6}: save {:.2f}s, load {:.2f}s, {:.1f}MB".format(
+        snapshot_format, save, load, size / 1e6))
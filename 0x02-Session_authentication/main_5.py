@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+""" Main 5
+Serializer benchmark: per-object cost of `to_json` and `_from_json`, and
+time of loading, saving and listing a store of users through
+GET /api/v1/users, with the serializers compiled for User and with the
+generic ones. Each variant runs in its own process, on the same file, and
+times are the best of 3 runs.
+
+Usage: ./main_5.py [users]
+"""
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+
+def best(function, runs=3):
+    """ Shortest time taken by `function` over `runs` calls """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def generate(users):
+    """ Write a .db_User.json file of `users` users """
+    objs = {}
+    for i in range(users):
+        user_id = str(uuid.uuid4())
+        objs[user_id] = {
+            "id": user_id,
+            "created_at": "2024-01-01T00:00:00",
+            "updated_at": "2024-01-02T00:00:00",
+            "email": "user{}@hbtn.io".format(i),
+            "_password": "a" * 64,
+            "first_name": None,
+            "last_name": None,
+        }
+    with open(".db_User.json", "w") as f:
+        json.dump(objs, f)
+
+
+def measure(variant):
+    """ Print the times of the serializers of `variant` """
+    os.environ["AUTH_TYPE"] = "basic_auth"
+    from models import base
+    from models.user import User
+
+    if variant == "generic":
+        base.SERIALIZERS[User] = (User._to_json,
+                                  lambda obj_json: User(**obj_json), None)
+    load = best(User.load_from_file)
+    users = User.all()
+    per_user = 1e6 / len(users)
+    to_json = best(lambda: [user.to_json() for user in users])
+    serialize = best(lambda: [user.to_json(True) for user in users])
+    objs = [user.to_json(True) for user in users]
+    from_json = best(lambda: [User._from_json(obj) for obj in objs])
+    save = best(User.save_to_file)
+
+    from api.v1.app import app
+    admin = User(email="admin@hbtn.io")
+    admin.password = "admin"
+    admin.save()
+    client = app.test_client()
+    headers = {"Authorization": "Basic " + base64.b64encode(
+        b"admin@hbtn.io:admin").decode()}
+    listing = best(lambda: client.get("/api/v1/users",
+                                      headers=headers).get_data())
+    print("{:>8}: to_json {:.2f}us, to_json(True) {:.2f}us, from_json "
+          "{:.2f}us | load {:.2f}s, save {:.2f}s, GET {:.2f}s".format(
+              variant, to_json * per_user, serialize * per_user,
+              from_json * per_user, load, save, listing), flush=True)
+
+
+if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+    os.chdir(sys.argv[3])
+    measure(sys.argv[2])
+else:
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    here = os.path.dirname(os.path.abspath(__file__))
+    """ Work in a scratch directory, not on the .db_* files of this one """
+    scratch = tempfile.mkdtemp()
+    os.chdir(scratch)
+    generate(users)
+    print("{} users".format(users), flush=True)
+    for variant in ("generic", "compiled"):
+        subprocess.run([sys.executable, os.path.abspath(__file__),
+                        "--measure", variant, scratch], check=True, cwd=here)
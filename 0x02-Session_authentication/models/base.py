@@ -1,37 +1,217 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from datetime import datetime, timedelta
+from typing import (Any, Callable, FrozenSet, TypeVar, List, Iterable,
+                    Optional, Tuple)
+from os import getenv
+from models import storage
+from models.flusher import FLUSHER
+from models.index import IndexSet, matches, parse_conditions
+from models.serializer import (OPTIONAL, REQUIRED, TIMESTAMP,
+                               TIMESTAMP_FORMAT, compile_from_json,
+                               compile_to_json, format_timestamp)
+from models.store import ObjectStore
+import hashlib
 import json
+import os
+import threading
 import uuid
 
 
-TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+TIMESTAMP_ATTRIBUTES = ("created_at", "updated_at")
 DATA = {}
+INDEXES = {}
+SERIALIZERS = {}
+PROJECTIONS = {}
+FRAGMENTS = {}
+VERSIONS = {}
+STORED_VERSIONS = {}
+SHARD_IDS = {}
+STAMPS = {}
+JOURNAL_OFFSETS = {}
+COMPACT = getenv("MODELS_COMPACT", "0") == "1"
+JSON_CACHE = getenv("MODELS_JSON_CACHE", "0") == "1"
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+_MISSING = object()
+_DATA_LOCK = threading.Lock()
+_FRAGMENTS_LOCK = threading.Lock()
+_ENCODE = json.JSONEncoder(sort_keys=True, separators=(",", ":")).encode
+PAGE_CHUNK = 256
+PROCESS_TOKEN = uuid.uuid4().hex
+
+
+def join_json(objs: Iterable[Any],
+              fields: Optional[Iterable[str]] = None) -> str:
+    """ JSON texts of objects separated by commas, as in a list encoded by
+    `jsonify`
+    Cached texts are used when there are some; otherwise every object is
+    encoded in the same call, which is faster than one call each.
+    """
+    if JSON_CACHE and fields is None:
+        return ",".join(obj.to_json_text() for obj in objs)
+    if fields is not None:
+        fields = frozenset(fields)
+    return _ENCODE([obj.to_json(fields=fields) for obj in objs])[1:-1]
+
+
+def _new_process_token():
+    """ Give a forked process its own token, so that its versions can't be
+    mistaken for those of its parent
+    """
+    global PROCESS_TOKEN
+    PROCESS_TOKEN = uuid.uuid4().hex
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_new_process_token)
+
+
+def parse_timestamp(value: Any) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+    Well-formed timestamps take the fast `fromisoformat` path; anything
+    else goes through `strptime`, which accepts the same inputs as before.
+    Datetimes, as decoded from binary snapshots, are returned as they are.
+    """
+    if type(value) is datetime:
+        return value
+    if len(value) == 19 and value[10] == "T":
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class Timestamp():
+    """ Timestamp attribute kept in a slot as integer microseconds since
+    the epoch, and read back as a naive datetime
+    Values that aren't naive datetimes are stored as they are.
+    """
+
+    def __init__(self, slot: str):
+        """ Initialize the attribute backed by `slot`
+        """
+        self.slot = slot
+
+    def __get__(self, obj: Any, owner: type = None) -> Any:
+        """ Value of the attribute
+        """
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if type(value) is int:
+            return EPOCH + value * MICROSECOND
+        return value
+
+    def __set__(self, obj: Any, value: Any):
+        """ Set the value of the attribute
+        """
+        if type(value) is datetime and value.tzinfo is None:
+            value = (value - EPOCH) // MICROSECOND
+        setattr(obj, self.slot, value)
 
 
 class Base():
     """ Base class
+
+    Persistence modes (`storage_mode`, default from MODELS_STORAGE):
+      - "snapshot": every save or remove rewrites .db_<class>.json
+      - "journal": every save or remove appends one line to
+        .db_<class>.journal; the journal is compacted into a new snapshot
+        once it grows past `journal_limit` bytes
+      - "sharded": objects are spread over `shards` files
+        .db_<class>.<i>-of-<shards>.json (MODELS_SHARDS) by a hash of
+        their ID; a save or remove only rewrites its shard, and the
+        shards are loaded by a pool of `load_workers` threads
+        (MODELS_LOAD_WORKERS). Existing files are converted with
+        `python3 -m models.storage reshard <class> <shards>`.
+
+    Snapshot and shard files are written in `snapshot_format`
+    (MODELS_FORMAT): "json", or "binary" for the compact format of
+    models.codec. Files are read in whichever format they were written,
+    and `python3 -m models.storage convert <class> <format>` rewrites
+    existing ones.
+
+    Attributes listed in `indexed` get a hash index, maintained on save,
+    remove and load, that `search` uses instead of scanning every object.
+    Attributes listed in `ordered` get a sorted index, which `query` uses
+    for prefix and range conditions. IDs always get one, for pagination.
+    Hash indexes are built by `load_from_file`, and each sorted index by
+    the first query or page that needs it.
+
+    With `lazy_load` (MODELS_LAZY_LOAD=1), `load_from_file` keeps the
+    serialized objects and only builds each one the first time it is
+    accessed.
+
+    Durability (`durability`, default from MODELS_DURABILITY):
+      - "immediate": every save or remove is persisted before it returns
+      - "batched": mutations are persisted by a background thread once
+        `flush_writes` of them are pending (MODELS_FLUSH_WRITES) or the
+        oldest is `flush_delay` seconds old (MODELS_FLUSH_DELAY)
+      - "shutdown": mutations are only persisted by `flush`
+    Pending mutations are always flushed at exit.
+
+    `to_json` and `_from_json` are compiled for each class the first time
+    they are used, from the attributes a new instance has. Objects that
+    don't have exactly those attributes take the generic path.
+
+    With MODELS_COMPACT=1, read at import time, instances have no
+    `__dict__`: attributes live in `__slots__` and timestamps are kept as
+    integers. Only the attributes a class declares can be set then.
+
+    With MODELS_JSON_CACHE=1, read at import time, `to_json_text` keeps
+    the JSON text of each object until one of its attributes is set,
+    which `save` does by bumping `updated_at`.
+
+    `version` tags the files of the class, counting writes in
+    .db_<class>.version, and `revision` the content of one object, so that
+    clients can tell whether what they have is still current, whichever
+    process answers them.
+
+    Objects and indexes of a class are guarded by the lock of its store,
+    and file writes by `storage.lock`, so the models can be shared by
+    request threads.
+
+    With `coherent` (MODELS_COHERENT=1), several processes can share the
+    files: reads check the files of the class for changes (modification
+    time, size and inode) and load what other processes wrote, following
+    the journal or reloading only changed shards when they can. Writes
+    hold `storage.file_lock` and merge the files into memory before
+    writing, so they don't overwrite the changes of other processes.
     """
 
+    if COMPACT:
+        __slots__ = ("id", "_created_at", "_updated_at")
+        created_at = Timestamp("_created_at")
+        updated_at = Timestamp("_updated_at")
+
+    storage_mode = getenv("MODELS_STORAGE", "snapshot")
+    journal_limit = int(getenv("MODELS_JOURNAL_LIMIT", 4 * 1024 * 1024))
+    shards = int(getenv("MODELS_SHARDS", 16))
+    load_workers = int(getenv("MODELS_LOAD_WORKERS", 4))
+    snapshot_format = getenv("MODELS_FORMAT", "json")
+    lazy_load = getenv("MODELS_LAZY_LOAD", "0") == "1"
+    coherent = getenv("MODELS_COHERENT", "0") == "1"
+    durability = getenv("MODELS_DURABILITY", "immediate")
+    flush_delay = float(getenv("MODELS_FLUSH_DELAY", 1.0))
+    flush_writes = int(getenv("MODELS_FLUSH_WRITES", 100))
+    indexed = ()
+    ordered = ("created_at", "updated_at")
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+        self.__class__._store()
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
@@ -44,88 +224,623 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
+    if JSON_CACHE:
+        def __setattr__(self, name: str, value: Any):
+            """ Set an attribute, dropping the cached JSON text
+            """
+            object.__setattr__(self, name, value)
+            fragments = FRAGMENTS.get(type(self).__name__)
+            obj_id = getattr(self, "id", None)
+            if fragments and obj_id in fragments:
+                with _FRAGMENTS_LOCK:
+                    fragments.pop(obj_id, None)
+
+    def to_json_text(self, fields: Optional[Iterable[str]] = None) -> str:
+        """ JSON text of `to_json(fields=fields)`, encoded as `jsonify` does
+        With MODELS_JSON_CACHE=1 the text of every field is cached until an
+        attribute of the object is set.
+        """
+        if not JSON_CACHE or fields is not None:
+            return _ENCODE(self.to_json(fields=fields))
+        fragments = FRAGMENTS.get(type(self).__name__)
+        if fragments is None:
+            fragments = FRAGMENTS.setdefault(type(self).__name__, {})
+        obj_id = self.id
+        entry = fragments.get(obj_id)
+        if entry is not None and entry[0] is self and entry[1] is not None:
+            return entry[1]
+        claim = fragments[obj_id] = (self, None)
+        text = _ENCODE(self.to_json())
+        with _FRAGMENTS_LOCK:
+            if fragments.get(obj_id) is claim:
+                fragments[obj_id] = (self, text)
+        return text
+
+    def to_json(self, for_serialization: bool = False,
+                fields: Optional[Iterable[str]] = None) -> dict:
         """ Convert the object a JSON dictionary
+        With `fields`, only the attributes it lists are read and converted.
+        """
+        if fields is None:
+            return type(self)._serializers()[0](self, for_serialization)
+        fields = frozenset(fields)
+        projection = PROJECTIONS.get((type(self), fields))
+        if projection is None:
+            projection = type(self)._projection(fields)
+        return projection(self, for_serialization, fields)
+
+    def _to_json(self, for_serialization: bool = False,
+                 fields: Optional[FrozenSet[str]] = None) -> dict:
+        """ Convert the object a JSON dictionary, whatever its attributes
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self._attributes():
             if not for_serialization and key[0] == '_':
                 continue
+            if fields is not None and key not in fields:
+                continue
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
+                result[key] = format_timestamp(value)
             else:
                 result[key] = value
         return result
 
+    def _attributes(self) -> Iterable[Tuple[str, Any]]:
+        """ (name, value) pairs of the attributes set on the object
+        """
+        if not COMPACT:
+            return self.__dict__.items()
+        attributes = []
+        for klass in reversed(type(self).__mro__):
+            for slot in klass.__dict__.get("__slots__", ()):
+                name = slot[1:] if slot[1:] in TIMESTAMP_ATTRIBUTES else slot
+                value = getattr(self, name, _MISSING)
+                if value is not _MISSING:
+                    attributes.append((name, value))
+        attributes.extend(getattr(self, "__dict__", {}).items())
+        return attributes
+
+    @classmethod
+    def _from_json(cls, obj_json: dict) -> TypeVar('Base'):
+        """ Build an object from its serialized dictionary
+        """
+        return cls._serializers()[1](obj_json)
+
+    @classmethod
+    def _serializers(cls) -> Tuple[Callable, Callable, Optional[tuple]]:
+        """ `to_json` and `_from_json` functions of the class, compiled on
+        first use, and the attribute names they were compiled for
+        A new instance gives the attribute names and their order; another
+        one, built from placeholder values, tells which attributes are
+        copied from the constructor arguments and which are parsed
+        timestamps. Classes whose instances don't fit that pattern keep
+        the generic functions, with no attribute names.
+        """
+        serializers = SERIALIZERS.get(cls)
+        if serializers is None:
+            serializers = SERIALIZERS[cls] = cls._compile()
+        return serializers
+
+    @classmethod
+    def _projection(cls, fields: FrozenSet[str]) -> Callable:
+        """ `to_json` function of the class for some fields, compiled on
+        first use for each set of known attribute names
+        PROJECTIONS only holds sets of known names, so requests for
+        unknown ones can't grow it.
+        """
+        names = cls._serializers()[2]
+        if names is None:
+            return cls._to_json
+        key = (cls, fields.intersection(names))
+        projection = PROJECTIONS.get(key)
+        if projection is None:
+            projection = PROJECTIONS[key] = compile_to_json(
+                names, COMPACT, cls._to_json, key[1])
+        return projection
+
+    @classmethod
+    def _compile(cls) -> Tuple[Callable, Callable, Optional[tuple]]:
+        """ Compile the `to_json` and `_from_json` functions of the class
+        """
+        def from_kwargs(obj_json):
+            return cls(**obj_json)
+
+        generic = (cls._to_json, from_kwargs, None)
+        if cls._attributes is not Base._attributes:
+            return generic
+        stamp = "2001-02-03T04:05:06"
+        try:
+            empty = dict(cls()._attributes())
+            probe_json = {name: stamp if type(value) is datetime
+                          else object() for name, value in empty.items()}
+            probe = dict(cls(**probe_json)._attributes())
+        except Exception:
+            return generic
+        if list(probe) != list(empty):
+            return generic
+        fields = []
+        for name, value in probe.items():
+            if probe_json[name] is value:
+                kind = OPTIONAL if empty[name] is None else REQUIRED
+            elif probe_json[name] == stamp and \
+                    value == parse_timestamp(stamp):
+                kind = TIMESTAMP
+            else:
+                return generic
+            fields.append((name, kind))
+        assign = None
+        if JSON_CACHE and cls.__setattr__ is Base.__setattr__:
+            assign = object.__setattr__
+        return (compile_to_json(list(empty), COMPACT, cls._to_json),
+                compile_from_json(cls, fields, parse_timestamp, from_kwargs,
+                                  assign),
+                tuple(empty))
+
+    @classmethod
+    def _store(cls) -> ObjectStore:
+        """ Store of the class, created on first use
+        """
+        store = DATA.get(cls.__name__)
+        if store is None:
+            with _DATA_LOCK:
+                store = DATA.setdefault(cls.__name__,
+                                        ObjectStore(cls._from_json))
+        return store
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+        The snapshot is streamed first, then any journaled mutations are
+        replayed on top of it. Pending mutations are flushed first.
+        """
+        s_class = cls.__name__
+        FLUSHER.flush(cls)
+        with cls._lock():
+            stamps = cls._stamps()
+            cls._reload()
+            STAMPS[s_class] = stamps
+            cls._remember(stamps)
+
+    @classmethod
+    def _reload(cls):
+        """ Replace the objects of the class with the content of its files
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        SHARD_IDS.pop(s_class, None)
+        FRAGMENTS.pop(s_class, None)
+        if cls.storage_mode == "sharded":
+            objs_json = cls._read_shards()
+        else:
+            objs_json = storage.read_snapshot(s_class)
+            JOURNAL_OFFSETS[s_class] = storage.replay_journal(s_class,
+                                                              objs_json)
+        store = cls._store()
+        with store.lock:
+            store.load(objs_json, cls.lazy_load)
+            cls._reindex()
+            cls._bump()
+
+    @classmethod
+    def _lock(cls):
+        """ Lock held while writing the files of the class: the file lock
+        shared with other processes when `coherent`, the thread lock
+        otherwise
+        """
+        if cls.coherent:
+            return storage.file_lock(cls.__name__)
+        return storage.lock(cls.__name__)
+
+    @classmethod
+    def _stamps(cls) -> dict:
+        """ Change markers of the files of the class, by path
+        """
+        s_class = cls.__name__
+        if cls.storage_mode == "sharded":
+            paths = [storage.shard_path(s_class, index, cls.shards)
+                     for index in range(cls.shards)]
+        else:
+            paths = [storage.snapshot_path(s_class)]
+            if cls.storage_mode == "journal":
+                paths.append(storage.journal_path(s_class))
+        return {file_path: storage.stamp(file_path) for file_path in paths}
+
+    @classmethod
+    def _stamp(cls):
+        """ Record a write to the files of the class, which are now in sync
+        with memory
+        """
+        s_class = cls.__name__
+        storage.bump_version(s_class)
+        stamps = STAMPS[s_class] = cls._stamps()
+        cls._remember(stamps)
+        if cls.coherent:
+            journal = stamps.get(storage.journal_path(s_class))
+            JOURNAL_OFFSETS[s_class] = journal[1] if journal else 0
+
+    @classmethod
+    def _sync(cls, keep: Iterable[str] = ()):
+        """ Load the changes other processes made to the files of the class
+        Only used when `coherent`. Objects in `keep`, and those with
+        pending mutations, keep their in-memory state.
+        """
+        if not cls.coherent:
             return
+        s_class = cls.__name__
+        with storage.lock(s_class):
+            stamps = cls._stamps()
+            seen = STAMPS.get(s_class)
+            if stamps == seen:
+                return
+            store = cls._store()
+            keep = set(keep).union(FLUSHER.pending_ids(cls))
+            kept = dict(store.raw_items(keep))
+            changes = cls._changes(stamps, seen or {})
+            with store.lock:
+                if changes is None:
+                    cls._reload()
+                else:
+                    cls._apply(*changes)
+                cls._apply([obj_id for obj_id in keep if obj_id not in kept],
+                           kept)
+            STAMPS[s_class] = stamps
+            cls._remember(stamps)
+
+    @classmethod
+    def _changes(cls, stamps: dict, seen: dict
+                 ) -> Optional[Tuple[List[str], dict]]:
+        """ Objects other processes removed and saved in the files of the
+        class since they were last seen
+        Return:
+          - (removed IDs, serialized objects by ID), or None if the class
+            has to be reloaded
+        """
+        s_class = cls.__name__
+        if not seen:
+            return None
+        removed, saved = [], {}
+        if cls.storage_mode == "sharded":
+            shard_ids = cls._shard_ids()
+            for index in range(cls.shards):
+                file_path = storage.shard_path(s_class, index, cls.shards)
+                if stamps[file_path] == seen.get(file_path):
+                    continue
+                objs_json = dict(storage.iter_file(file_path))
+                removed.extend(obj_id for obj_id in shard_ids[index]
+                               if obj_id not in objs_json)
+                shard_ids[index] = dict.fromkeys(objs_json)
+                saved.update(objs_json)
+            return removed, saved
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        snapshot = storage.snapshot_path(s_class)
+        journal = storage.journal_path(s_class)
+        offset = JOURNAL_OFFSETS.get(s_class, 0)
+        if cls.storage_mode != "journal" or \
+                stamps[snapshot] != seen.get(snapshot) or \
+                stamps[journal] is None or stamps[journal][1] < offset or \
+                (seen.get(journal) or stamps[journal])[2] != \
+                stamps[journal][2]:
+            return None
+        entries, JOURNAL_OFFSETS[s_class] = storage.read_journal(s_class,
+                                                                 offset)
+        for entry in entries:
+            if entry["op"] == "save":
+                saved[entry["id"]] = entry["obj"]
+            else:
+                saved.pop(entry["id"], None)
+                removed.append(entry["id"])
+        return removed, saved
+
+    @classmethod
+    def _apply(cls, removed: Iterable[str], saved: dict):
+        """ Remove and replace objects in memory, keeping the indexes up to
+        date
+        Entries of `saved` are objects or serialized objects.
+        """
+        store = cls._store()
+        indexes = INDEXES.get(cls.__name__)
+        fragments = FRAGMENTS.get(cls.__name__, {})
+        with store.lock:
+            for obj_id in removed:
+                fragments.pop(obj_id, None)
+                if obj_id in store:
+                    del store[obj_id]
+                if indexes is not None:
+                    indexes.discard(obj_id)
+            for obj_id, obj in saved.items():
+                if type(obj) is dict:
+                    obj = cls._from_json(obj)
+                store[obj_id] = obj
+                if indexes is not None:
+                    indexes.add(obj)
+            cls._bump()
+
+    @classmethod
+    def _read_shards(cls) -> dict:
+        """ Read the shard files of the class
+        Raise ValueError if they were written with another shard count, or
+        if the class is stored in a snapshot or journal and has no shard
+        files yet: its objects would be missed, and lost on the next save.
+        """
+        s_class = cls.__name__
+        counts = {shards for _, shards in storage.shard_paths(s_class)}
+        if not counts:
+            unsharded = [file_path for file_path in (
+                storage.snapshot_path(s_class), storage.journal_path(s_class))
+                if os.path.exists(file_path)]
+            if unsharded:
+                raise ValueError(
+                    "{} is stored in {}, not in shards: run "
+                    "`python3 -m models.storage reshard {} {}`".format(
+                        s_class, " and ".join(unsharded), s_class,
+                        cls.shards))
+        if counts - {cls.shards}:
+            raise ValueError(
+                "{} is stored in {} shards, not {}: run "
+                "`python3 -m models.storage reshard {} {}`".format(
+                    s_class, "/".join(map(str, sorted(counts))),
+                    cls.shards, s_class, cls.shards))
+        return storage.read_shards(s_class, cls.load_workers)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
+        Objects that were never accessed since a lazy load are written back
+        as they were read.
+        """
+        s_class = cls.__name__
+        with cls._lock():
+            cls._sync()
+            if cls.storage_mode == "sharded":
+                cls._save_shards(range(cls.shards))
+            else:
+                objs_json = {}
+                for obj_id, obj in cls._store().raw_items():
+                    objs_json[obj_id] = obj if type(obj) is dict \
+                        else obj.to_json(True)
+
+                storage.write_snapshot(s_class, objs_json,
+                                       cls.snapshot_format)
+            cls._stamp()
+
+    @classmethod
+    def _shard_ids(cls) -> List[dict]:
+        """ IDs of the objects of each shard file, built on first use
+        Kept up to date by `_write`, under `storage.lock`.
+        """
+        shard_ids = SHARD_IDS.get(cls.__name__)
+        if shard_ids is None or len(shard_ids) != cls.shards:
+            shard_ids = [{} for _ in range(cls.shards)]
+            for obj_id in cls._store().keys():
+                shard_ids[storage.shard_of(obj_id, cls.shards)][obj_id] = None
+            SHARD_IDS[cls.__name__] = shard_ids
+        return shard_ids
+
+    @classmethod
+    def _save_shards(cls, indexes: Iterable[int]):
+        """ Rewrite some shard files of the class
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with cls._lock():
+            shard_ids = cls._shard_ids()
+            for index in indexes:
+                objs_json = {}
+                for obj_id, obj in cls._store().raw_items(shard_ids[index]):
+                    objs_json[obj_id] = obj if type(obj) is dict \
+                        else obj.to_json(True)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+                storage.write_shard(s_class, index, cls.shards, objs_json,
+                                    cls.snapshot_format)
+
+    @classmethod
+    def _persist(cls, op: str, obj: TypeVar('Base')):
+        """ Persist one mutation according to `durability`
+        """
+        obj_json = None
+        if op == "save" and cls.storage_mode == "journal":
+            obj_json = obj.to_json(True)
+        if cls.durability == "immediate":
+            cls._write([(op, obj.id, obj_json)])
+        else:
+            FLUSHER.mark(cls, (op, obj.id, obj_json))
+
+    @classmethod
+    def _write(cls, entries: List[Tuple[str, str, dict]]):
+        """ Write mutations according to `storage_mode`
+        """
+        with cls._lock():
+            cls._sync(obj_id for _, obj_id, _ in entries)
+            if cls.storage_mode == "sharded":
+                shard_ids = cls._shard_ids()
+                indexes = set()
+                for op, obj_id, _ in entries:
+                    index = storage.shard_of(obj_id, cls.shards)
+                    if op == "save":
+                        shard_ids[index][obj_id] = None
+                    else:
+                        shard_ids[index].pop(obj_id, None)
+                    indexes.add(index)
+                cls._save_shards(indexes)
+                cls._stamp()
+            elif cls.storage_mode != "journal":
+                cls.save_to_file()
+            else:
+                size = storage.append_journal(cls.__name__, entries)
+                cls._stamp()
+                if size > cls.journal_limit:
+                    cls.save_to_file()
+
+    @classmethod
+    def flush(cls):
+        """ Persist the pending mutations of the class now
+        """
+        FLUSHER.flush(cls)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
+        cls = self.__class__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        store = cls._store()
+        with store.lock:
+            store[self.id] = self
+            cls._indexes().add(self)
+            cls._bump()
+        cls._persist("save", self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        cls = self.__class__
+        store = cls._store()
+        with store.lock:
+            if self.id not in store:
+                return
+            del store[self.id]
+            cls._indexes().discard(self.id)
+            FRAGMENTS.get(cls.__name__, {}).pop(self.id, None)
+            cls._bump()
+        cls._persist("remove", self)
+
+    @classmethod
+    def _indexes(cls) -> IndexSet:
+        """ Indexes of the class, created on first use
+        `load_from_file` builds the hash indexes; sorted indexes are built
+        by the first query that needs them.
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.get(s_class)
+        if indexes is None:
+            store = cls._store()
+            with store.lock:
+                indexes = INDEXES.get(s_class)
+                if indexes is None:
+                    ordered = ("id",) + tuple(attr for attr in cls.ordered
+                                              if attr != "id")
+                    indexes = IndexSet(cls.indexed, ordered, store.raw_items,
+                                       cls._value_of)
+                    indexes.rebuild()
+                    INDEXES[s_class] = indexes
+        return indexes
+
+    @classmethod
+    def _reindex(cls):
+        """ Rebuild the indexes from the loaded objects
+        Serialized objects are indexed without being built.
+        """
+        indexes = INDEXES.get(cls.__name__)
+        if indexes is None:
+            cls._indexes()
+            return
+        with cls._store().lock:
+            indexes.rebuild()
+
+    @staticmethod
+    def _value_of(obj: TypeVar('Base'), attr: str):
+        """ Value of an attribute of an object or serialized object
+        """
+        if type(obj) is not dict:
+            return getattr(obj, attr, None)
+        value = obj.get(attr)
+        if attr in TIMESTAMP_ATTRIBUTES and type(value) is str:
+            return parse_timestamp(value)
+        return value
+
+    @classmethod
+    def _bump(cls):
+        """ Record that objects of the class were saved, removed or loaded,
+        under the lock of its store
+        """
+        s_class = cls.__name__
+        VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+
+    @classmethod
+    def _remember(cls, stamps: dict):
+        """ Record the files of the class, with their change markers
+        `stamps`, as holding the objects in memory
+        The tag of that state comes from the files and their write count,
+        so every process that loaded the same files gets the same tag.
+        """
+        s_class = cls.__name__
+        text = "{}\n{}".format(storage.read_version(s_class),
+                               sorted(stamps.items()))
+        STORED_VERSIONS[s_class] = hashlib.sha1(text.encode()).hexdigest()
+
+    @classmethod
+    def version(cls) -> str:
+        """ Tag of the current state of the objects of the class
+        It is the tag of the files of the class as last loaded, synced or
+        written, so processes serving the same files, before or after a
+        restart, give the same tag. While mutations are waiting to be
+        written (batched or shutdown durability), it also depends on the
+        process and changes with every save or remove. Between a save and
+        its write the tag still names the files, so a client may be told
+        its copy is current until the write lands.
+        """
+        cls._sync()
+        s_class = cls.__name__
+        stored = STORED_VERSIONS.get(s_class, "")
+        if not FLUSHER.pending_ids(cls):
+            return stored
+        return "{}-{}-{}".format(stored, PROCESS_TOKEN,
+                                 VERSIONS.get(s_class, 0))
+
+    @classmethod
+    def revision(cls, id: str) -> Optional[str]:
+        """ Tag of the state of one object, read without building it
+        It is a hash of the public representation of the object, so every
+        process serving the same object gives the same tag, and any change
+        to what `to_json` returns changes it.
+        Return:
+          - None if there is no object with this ID
+        """
+        cls._sync()
+        store = cls._store()
+        with store.lock:
+            for obj_id, obj in store.raw_items((id,)):
+                if type(obj) is dict:
+                    obj_json = {key: format_timestamp(value)
+                                if type(value) is datetime else value
+                                for key, value in obj.items()
+                                if key[0] != "_"}
+                    text = _ENCODE(obj_json)
+                else:
+                    text = obj.to_json_text()
+                return hashlib.sha1(text.encode()).hexdigest()
+        return None
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        cls._sync()
+        return len(cls._store())
 
     @classmethod
-    def all(cls) -> Iterable[TypeVar('Base')]:
+    def all(cls, limit: Optional[int] = None,
+            cursor: Optional[str] = None) -> Iterable[TypeVar('Base')]:
         """ Return all objects
+        `limit` and `cursor` paginate them, as in `search`.
         """
-        return cls.search()
+        return cls.search({}, limit, cursor)
 
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        cls._sync()
+        return cls._store().get(id)
 
     @classmethod
-    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+    def search(cls, attributes: dict = {}, limit: Optional[int] = None,
+               cursor: Optional[str] = None) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+        When an attribute of the query is indexed, only the objects the
+        index returns for its value are checked. Indexes reflect the
+        objects as they were last saved.
+        With `limit` or `cursor`, matching objects are returned in ID
+        order: at most `limit` of them, with IDs greater than `cursor`.
+        The ID of the last object of a page is the cursor of the next one.
         """
-        s_class = cls.__name__
         def _search(obj):
             if len(attributes) == 0:
                 return True
@@ -133,5 +848,90 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        cls._sync()
+        if limit is not None or cursor is not None:
+            return cls._page(_search, attributes, limit, cursor)
+        store = cls._store()
+        objs = None
+        with store.lock:
+            indexes = cls._indexes().hashed
+            for k, v in attributes.items():
+                if k not in indexes:
+                    continue
+                try:
+                    ids = indexes[k].lookup(v)
+                except TypeError:
+                    continue
+                objs = store.get_many(ids)
+                break
+        if objs is None:
+            objs = store.values()
+
+        return list(filter(_search, objs))
+
+    @classmethod
+    def _page(cls, match: Callable[[TypeVar('Base')], bool],
+              attributes: dict, limit: Optional[int],
+              cursor: Optional[str]) -> List[TypeVar('Base')]:
+        """ Page of the objects accepted by `match`, in ID order
+        An indexed attribute narrows the candidates; otherwise the ID index
+        is walked PAGE_CHUNK objects at a time until the page is full.
+        """
+        store = cls._store()
+        with store.lock:
+            indexes = cls._indexes()
+            for k, v in attributes.items():
+                if k not in indexes.hashed:
+                    continue
+                try:
+                    ids = indexes.hashed[k].lookup(v)
+                except TypeError:
+                    continue
+                ids = sorted(obj_id for obj_id in ids
+                             if cursor is None or obj_id > cursor)
+                objs = [obj for obj in store.get_many(ids) if match(obj)]
+                return objs[:limit]
+
+        objs = []
+        while limit is None or len(objs) < limit:
+            with store.lock:
+                ids = indexes.sorted_index("id").first(PAGE_CHUNK, cursor)
+                chunk = store.get_many(ids)
+            if not ids:
+                break
+            cursor = ids[-1]
+            objs.extend(obj for obj in chunk if match(obj))
+        return objs[:limit]
+
+    @classmethod
+    def query(cls, filters: dict = {}) -> List[TypeVar('Base')]:
+        """ Search all objects matching prefix, range and equality filters
+        Filter keys are attribute names, optionally suffixed with
+        `__prefix`, `__gt`, `__gte`, `__lt` or `__lte`:
+            User.query({"email__prefix": "bob",
+                        "created_at__gte": datetime(2024, 1, 1)})
+        Timestamps can also be given as TIMESTAMP_FORMAT strings.
+        The most selective indexed condition picks the candidates, which
+        are narrowed by the other indexed conditions before any object is
+        loaded; objects are then checked against every condition.
+        Return:
+          - matching objects, in the order of the driving index
+        """
+        conditions = []
+        for attr, op, value in parse_conditions(filters):
+            if attr in TIMESTAMP_ATTRIBUTES and type(value) is str:
+                value = parse_timestamp(value)
+            conditions.append((attr, op, value))
+
+        cls._sync()
+        store = cls._store()
+        with store.lock:
+            ids = cls._indexes().candidates(conditions)
+            if ids is not None:
+                objs = store.get_many(ids)
+        if ids is None:
+            objs = store.values()
+        return [obj for obj in objs
+                if all(matches(getattr(obj, attr, None), op, value)
+                       for attr, op, value in conditions)]
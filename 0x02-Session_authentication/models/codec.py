@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+""" Binary snapshot codec
+
+A binary snapshot starts with MAGIC, followed by records. Each record is
+a 4-byte length, a kind byte and a body:
+  - FIELD: a UTF-8 field name, interned under the next field number
+  - SHAPE: the (field number, value type) pairs of an object layout,
+    interned under the next shape number
+  - OBJECT: a shape number, the fixed-width values of the object (string
+    lengths, 8-byte integers, floats and timestamps), then the UTF-8 bytes
+    of its ID and string values
+Booleans are single bytes. Timestamps are stored as 8-byte microseconds
+since the epoch and decoded as naive datetimes. Values that don't fit
+another type are stored as JSON text. Integers are little-endian.
+"""
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Iterable, Iterator, Optional, Tuple
+import json
+import re
+import struct
+
+
+MAGIC = b"\x93MDB\x01\r\n\x1a"
+TIMESTAMP_FIELDS = ("created_at", "updated_at")
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+FIELD, SHAPE, OBJECT = 0, 1, 2
+NONE, BOOL, STR, INT, FLOAT, TIMESTAMP, JSON = range(7)
+_FORMATS = {BOOL: "?", STR: "I", INT: "q", FLOAT: "d", TIMESTAMP: "q",
+            JSON: "I"}
+_HEADER = struct.Struct("<IB")
+_SHAPE_ID = struct.Struct("<H")
+_SHAPE_FIELD = struct.Struct("<HB")
+_INT_MIN, _INT_MAX = -2 ** 63, 2 ** 63 - 1
+_TIMESTAMP = re.compile(r'[1-9]\d{3}-\d\d-\d\dT\d\d:\d\d:\d\d')
+
+
+def _kind(name: str, value: Any) -> int:
+    """ Type a value is stored as
+    Timestamp strings that aren't valid dates, such as February 30th, are
+    stored as strings.
+    """
+    kind = type(value)
+    if value is None:
+        return NONE
+    if kind is bool:
+        return BOOL
+    if kind is str:
+        if name in TIMESTAMP_FIELDS and _TIMESTAMP.fullmatch(value):
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                return STR
+            return TIMESTAMP
+        return STR
+    if kind is int and _INT_MIN <= value <= _INT_MAX:
+        return INT
+    if kind is float:
+        return FLOAT
+    if kind is datetime and value.tzinfo is None:
+        return TIMESTAMP
+    return JSON
+
+
+def _struct(layout: Iterable[Tuple[Any, int]]) -> struct.Struct:
+    """ Struct of the shape number, ID length and fixed-width values of
+    a layout
+    """
+    return struct.Struct("<HI" + "".join(_FORMATS.get(kind, "")
+                                         for _, kind in layout))
+
+
+def _record(kind: int, body: bytes) -> bytes:
+    """ Frame a record
+    """
+    return _HEADER.pack(len(body), kind) + body
+
+
+def _encode(kinds: Tuple[int, ...], values: Iterable[Any]
+            ) -> Optional[Tuple[list, list, int]]:
+    """ Fixed-width values and string bytes of an object
+    Return:
+      - (fixed-width values, byte strings, total bytes length), or None if
+        a value doesn't have the expected type
+    """
+    fixed, blobs, size = [], [], 0
+    for kind, value in zip(kinds, values):
+        if kind == STR:
+            value = value.encode()
+        elif kind == TIMESTAMP:
+            if type(value) is str:
+                if not _TIMESTAMP.fullmatch(value):
+                    return None
+                try:
+                    value = datetime.fromisoformat(value)
+                except ValueError:
+                    return None
+            elif type(value) is not datetime or value.tzinfo is not None:
+                return None
+            fixed.append((value - EPOCH) // MICROSECOND)
+            continue
+        elif kind == INT:
+            if not _INT_MIN <= value <= _INT_MAX:
+                return None
+        elif kind == JSON:
+            value = json.dumps(value).encode()
+        elif kind == NONE:
+            continue
+        if kind == STR or kind == JSON:
+            fixed.append(len(value))
+            blobs.append(value)
+            size += len(value)
+        else:
+            fixed.append(value)
+    return fixed, blobs, size
+
+
+def dump(objs_json: dict, f: BinaryIO):
+    """ Write serialized objects by ID as a binary snapshot
+    Objects with the same field names and value types share an encoding
+    plan, so the type of each value is only worked out once per layout.
+    """
+    fields, shapes, plans = {}, {}, {}
+    out = [MAGIC]
+    for obj_id, obj_json in objs_json.items():
+        values = obj_json.values()
+        signature = (tuple(obj_json), tuple(map(type, values)))
+        plan = plans.get(signature)
+        encoded = _encode(plan[2], values) if plan is not None else None
+        if encoded is None:
+            layout = []
+            for name, value in obj_json.items():
+                field = fields.get(name)
+                if field is None:
+                    field = fields[name] = len(fields)
+                    out.append(_record(FIELD, name.encode()))
+                layout.append((field, _kind(name, value)))
+            layout = tuple(layout)
+            shape = shapes.get(layout)
+            if shape is None:
+                shape = shapes[layout] = (len(shapes), _struct(layout))
+                out.append(_record(SHAPE, b"".join(
+                    _SHAPE_FIELD.pack(*field) for field in layout)))
+            plan = shape + (tuple(kind for _, kind in layout),)
+            plans[signature] = plan
+            encoded = _encode(plan[2], values)
+        shape_id, packer, _ = plan
+        fixed, blobs, size = encoded
+        id_bytes = obj_id.encode()
+        size += packer.size + len(id_bytes)
+        out.append(_HEADER.pack(size, OBJECT))
+        out.append(packer.pack(shape_id, len(id_bytes), *fixed))
+        out.append(id_bytes)
+        out.extend(blobs)
+    f.write(b"".join(out))
+
+
+def _read(f: BinaryIO, size: int) -> bytes:
+    """ Read exactly `size` bytes
+    """
+    data = f.read(size)
+    if len(data) < size:
+        raise ValueError("truncated binary snapshot")
+    return data
+
+
+def load(f: BinaryIO) -> Iterator[Tuple[str, dict]]:
+    """ Stream the (ID, serialized object) pairs of a binary snapshot
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a binary snapshot")
+    names, shapes = [], []
+    while True:
+        header = f.read(_HEADER.size)
+        if not header:
+            return
+        if len(header) < _HEADER.size:
+            raise ValueError("truncated binary snapshot")
+        size, kind = _HEADER.unpack(header)
+        body = _read(f, size)
+        if kind == OBJECT:
+            yield _decode(body, shapes)
+        elif kind == FIELD:
+            names.append(body.decode())
+        elif kind == SHAPE:
+            layout = [(names[field], kind) for field, kind
+                      in _SHAPE_FIELD.iter_unpack(body)]
+            shapes.append((layout, _struct(layout)))
+        else:
+            raise ValueError("unknown record kind {}".format(kind))
+
+
+def _decode(body: bytes, shapes: list) -> Tuple[str, dict]:
+    """ Decode an OBJECT record body
+    """
+    layout, unpacker = shapes[_SHAPE_ID.unpack_from(body)[0]]
+    fixed = unpacker.unpack_from(body)
+    pos = unpacker.size + fixed[1]
+    obj_id = body[unpacker.size:pos].decode()
+    obj_json = {}
+    i = 2
+    for name, kind in layout:
+        if kind == STR:
+            end = pos + fixed[i]
+            obj_json[name] = body[pos:end].decode()
+            pos, i = end, i + 1
+        elif kind == NONE:
+            obj_json[name] = None
+        elif kind == TIMESTAMP:
+            obj_json[name] = EPOCH + fixed[i] * MICROSECOND
+            i += 1
+        elif kind == JSON:
+            end = pos + fixed[i]
+            obj_json[name] = json.loads(body[pos:end])
+            pos, i = end, i + 1
+        else:
+            obj_json[name] = fixed[i]
+            i += 1
+    return obj_id, obj_json
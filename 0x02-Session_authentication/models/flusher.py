@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+""" Flusher module
+"""
+from typing import List, Optional, Tuple
+import atexit
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Flusher():
+    """ Write-behind persistence of model classes
+    Mutations are queued per class and written by `cls._write(entries)`,
+    where entries are (operation, object ID, serialized object) tuples.
+    Classes with the "batched" durability are flushed by a background
+    thread once `cls.flush_writes` mutations are pending or the oldest one
+    is `cls.flush_delay` seconds old. Everything pending is flushed at
+    exit. A forked child starts with nothing pending and its own thread,
+    leaving what the parent had pending to the parent.
+    Mutations whose write fails stay pending, ahead of newer ones; the
+    background thread logs the error and retries the class after
+    `cls.flush_delay` seconds.
+    """
+
+    def __init__(self):
+        """ Initialize a flusher with nothing pending
+        """
+        self._reset()
+        atexit.register(self.flush)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """ Forget pending mutations and the background thread
+        """
+        self._cond = threading.Condition()
+        self._io = threading.Lock()
+        self._pending = {}
+        self._since = {}
+        self._retry = {}
+        self._thread = None
+
+    def mark(self, cls: type, entry: Tuple[str, str, Optional[dict]]):
+        """ Queue a mutation of `cls` to be written later
+        """
+        with self._cond:
+            entries = self._pending.setdefault(cls, [])
+            if not entries:
+                self._since[cls] = time.monotonic()
+            entries.append(entry)
+            if cls.durability == "batched":
+                self._start()
+                self._cond.notify()
+
+    def pending(self, cls: type) -> int:
+        """ Number of mutations of `cls` waiting to be written
+        """
+        with self._cond:
+            return len(self._pending.get(cls, ()))
+
+    def pending_ids(self, cls: type) -> List[str]:
+        """ IDs of the objects of `cls` with mutations waiting to be written
+        """
+        with self._cond:
+            return [obj_id for _, obj_id, _ in self._pending.get(cls, ())]
+
+    def flush(self, cls: type = None):
+        """ Write the pending mutations of `cls`, or of every class, now
+        Classes are written one at a time: when the write of a class
+        fails, its mutations are queued again and the first error is
+        raised once the other classes are written.
+        """
+        error = None
+        with self._io:
+            with self._cond:
+                classes = [cls] if cls is not None else list(self._pending)
+                batches = [(c, self._pending.pop(c), self._since.get(c))
+                           for c in classes if c in self._pending]
+            for c, entries, since in batches:
+                try:
+                    c._write(entries)
+                except Exception as e:
+                    self._requeue(c, entries, since)
+                    if error is None:
+                        error = e
+        if error is not None:
+            raise error
+
+    def _requeue(self, cls: type, entries: list, since: float):
+        """ Put back mutations of `cls` that failed to be written, ahead of
+        those queued since
+        """
+        with self._cond:
+            self._pending[cls] = entries + self._pending.get(cls, [])
+            self._since[cls] = since
+
+    def _start(self):
+        """ Start the background thread if it isn't running
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name="models-flusher",
+                                            daemon=True)
+            self._thread.start()
+
+    def _due(self) -> Tuple[List[type], Optional[float]]:
+        """ Batched classes due for a flush, and the number of seconds
+        until the next one is
+        """
+        now = time.monotonic()
+        due, timeout = [], None
+        for cls, entries in self._pending.items():
+            if cls.durability != "batched":
+                continue
+            wait = self._since[cls] + cls.flush_delay - now
+            retry = self._retry.get(cls, now) - now
+            if retry > 0:
+                wait = retry
+            elif len(entries) >= cls.flush_writes or wait <= 0:
+                due.append(cls)
+                continue
+            if timeout is None or wait < timeout:
+                timeout = wait
+        return due, timeout
+
+    def _run(self):
+        """ Flush batched classes as they become due
+        A class whose write fails is retried `cls.flush_delay` seconds
+        later, without stopping the thread.
+        """
+        while True:
+            with self._cond:
+                due, timeout = self._due()
+                while not due:
+                    self._cond.wait(timeout)
+                    due, timeout = self._due()
+            for cls in due:
+                try:
+                    self.flush(cls)
+                    retry = None
+                except Exception:
+                    logger.exception("Flushing %s failed, retrying in %ss",
+                                     cls.__name__, cls.flush_delay)
+                    retry = time.monotonic() + cls.flush_delay
+                with self._cond:
+                    if retry is None:
+                        self._retry.pop(cls, None)
+                    else:
+                        self._retry[cls] = retry
+
+
+FLUSHER = Flusher()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+""" Index module
+"""
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+
+class HashIndex():
+    """ Hash index of one attribute: value -> IDs of the objects holding it
+    IDs are kept in the order they were indexed. Unhashable values are not
+    indexed.
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index on `attribute`
+        """
+        self.attribute = attribute
+        self._ids = {}
+        self._values = {}
+
+    def add(self, obj_id: str, value: Any):
+        """ Index `value` for the object `obj_id`, replacing its old value
+        """
+        if obj_id in self._values:
+            if self._values[obj_id] == value:
+                return
+            self.discard(obj_id)
+        try:
+            self._ids.setdefault(value, {})[obj_id] = None
+        except TypeError:
+            return
+        self._values[obj_id] = value
+
+    def discard(self, obj_id: str):
+        """ Remove the object `obj_id` from the index
+        """
+        if obj_id not in self._values:
+            return
+        value = self._values.pop(obj_id)
+        ids = self._ids[value]
+        del ids[obj_id]
+        if not ids:
+            del self._ids[value]
+
+    def lookup(self, value: Any) -> List[str]:
+        """ IDs of the objects indexed with `value`
+        Raise TypeError if `value` is unhashable.
+        """
+        return list(self._ids.get(value, ()))
+
+    def clear(self):
+        """ Remove every object from the index
+        """
+        self._ids.clear()
+        self._values.clear()
+
+
+class _Top():
+    """ Sentinel comparing greater than any object ID
+    """
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+_TOP = _Top()
+
+
+class SortedIndex():
+    """ Sorted index of one attribute, for prefix and range queries
+    Entries are (value, ID) pairs kept sorted with bisect. None values
+    never match a prefix or range condition and are not indexed. Values
+    that can't be ordered against the indexed ones are kept aside and
+    returned with every range so that they are still checked.
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index on `attribute`
+        """
+        self.attribute = attribute
+        self._entries = []
+        self._values = {}
+        self._unordered = {}
+
+    def add(self, obj_id: str, value: Any):
+        """ Index `value` for the object `obj_id`, replacing its old value
+        """
+        self.discard(obj_id)
+        if value is None:
+            return
+        try:
+            insort(self._entries, (value, obj_id))
+        except TypeError:
+            self._unordered[obj_id] = None
+            return
+        self._values[obj_id] = value
+
+    def extend(self, pairs: Iterable[Tuple[str, Any]]):
+        """ Index many (ID, value) pairs of objects not indexed yet
+        The entries are sorted once instead of being inserted one by one.
+        """
+        entries = [(value, obj_id) for obj_id, value in pairs
+                   if value is not None]
+        try:
+            entries.sort()
+        except TypeError:
+            for value, obj_id in entries:
+                self.add(obj_id, value)
+            return
+        if self._entries:
+            entries = sorted(self._entries + entries)
+        self._entries = entries
+        self._values.update((obj_id, value) for value, obj_id in entries)
+
+    def discard(self, obj_id: str):
+        """ Remove the object `obj_id` from the index
+        """
+        self._unordered.pop(obj_id, None)
+        if obj_id not in self._values:
+            return
+        entry = (self._values.pop(obj_id), obj_id)
+        del self._entries[bisect_left(self._entries, entry)]
+
+    def clear(self):
+        """ Remove every object from the index
+        """
+        self._entries = []
+        self._values.clear()
+        self._unordered.clear()
+
+    def value(self, obj_id: str) -> Any:
+        """ Indexed value of the object `obj_id`, None if it has none
+        """
+        return self._values.get(obj_id)
+
+    def bounds(self, op: str, target: Any) -> Tuple[int, int]:
+        """ Positions of the entries matching a condition
+        Return:
+          - (start, end) slice of the sorted entries
+        """
+        entries = self._entries
+        if op == "prefix":
+            start = bisect_left(entries, (target,))
+            end = start
+            while end < len(entries) and \
+                    isinstance(entries[end][0], str) and \
+                    entries[end][0].startswith(target):
+                end += 1
+            return start, end
+        start, end = 0, len(entries)
+        if op in ("eq", "gte"):
+            start = bisect_left(entries, (target,))
+        elif op == "gt":
+            start = bisect_right(entries, (target, _TOP))
+        if op in ("eq", "lte"):
+            end = bisect_right(entries, (target, _TOP))
+        elif op == "lt":
+            end = bisect_left(entries, (target,))
+        return start, max(start, end)
+
+    def first(self, count: int, after: Any = None) -> List[str]:
+        """ IDs of the first `count` objects in value order, only counting
+        values greater than `after` when it is given
+        """
+        start = 0
+        if after is not None:
+            start = bisect_right(self._entries, (after, _TOP))
+        return [obj_id for _, obj_id in self._entries[start:start + count]]
+
+    def lookup(self, op: str, target: Any) -> List[str]:
+        """ IDs of the objects that may match a condition, in value order
+        """
+        start, end = self.bounds(op, target)
+        ids = [obj_id for _, obj_id in self._entries[start:end]]
+        return ids + list(self._unordered)
+
+
+OPERATORS = ("eq", "prefix", "gt", "gte", "lt", "lte")
+
+
+def parse_conditions(filters: dict) -> List[Tuple[str, str, Any]]:
+    """ Split query filters into (attribute, operator, value) conditions
+    A filter key is an attribute name, optionally followed by `__` and one
+    of OPERATORS: {"email__prefix": "bob", "created_at__gte": date}.
+    """
+    conditions = []
+    for key, value in filters.items():
+        attribute, _, op = key.partition("__")
+        op = op or "eq"
+        if op not in OPERATORS:
+            raise ValueError("unknown query operator: {}".format(op))
+        conditions.append((attribute, op, value))
+    return conditions
+
+
+def matches(value: Any, op: str, target: Any) -> bool:
+    """ Check a value against a condition
+    """
+    if op == "eq":
+        return value == target
+    if value is None:
+        return False
+    try:
+        if op == "prefix":
+            return isinstance(value, str) and value.startswith(target)
+        if op == "gt":
+            return value > target
+        if op == "gte":
+            return value >= target
+        if op == "lt":
+            return value < target
+        return value <= target
+    except TypeError:
+        return False
+
+
+class IndexSet():
+    """ Hash and sorted indexes of a model class, and the query planner
+    Hash indexes are built by `rebuild`. Each sorted index is only built
+    from `entries` the first time a query needs it, so that equality
+    searches don't pay for sorting.
+    """
+
+    def __init__(self, hashed: Iterable[str], ordered: Iterable[str],
+                 entries: Callable[[], Iterable[Tuple[str, Any]]],
+                 value_of: Callable[[Any, str], Any]):
+        """ Initialize empty indexes on the given attributes
+        `entries()` returns the (ID, entry) pairs of the indexed objects,
+        and `value_of(entry, attribute)` the value to index, so entries
+        don't have to be objects.
+        """
+        self.hashed = {attr: HashIndex(attr) for attr in hashed}
+        self.ordered = {attr: SortedIndex(attr) for attr in ordered}
+        self._entries = entries
+        self._value_of = value_of
+        self._built = {}
+
+    def _all(self) -> list:
+        """ Every index of the set that is built
+        """
+        return list(self.hashed.values()) + list(self._built.values())
+
+    def sorted_index(self, attribute: str) -> SortedIndex:
+        """ Sorted index of `attribute`, built on first use
+        """
+        index = self._built.get(attribute)
+        if index is None:
+            index = self.ordered[attribute]
+            index.clear()
+            index.extend((obj_id, self._value_of(entry, attribute))
+                         for obj_id, entry in self._entries())
+            self._built[attribute] = index
+        return index
+
+    def add(self, obj: Any):
+        """ Index the current attribute values of `obj`
+        """
+        for index in self._all():
+            index.add(obj.id, getattr(obj, index.attribute, None))
+
+    def discard(self, obj_id: str):
+        """ Remove the object `obj_id` from every index
+        """
+        for index in self._all():
+            index.discard(obj_id)
+
+    def rebuild(self):
+        """ Rebuild the hash indexes from `entries`, and drop the sorted
+        ones until they are needed again
+        """
+        entries = list(self._entries())
+        value_of = self._value_of
+        for index in self.hashed.values():
+            index.clear()
+            for obj_id, entry in entries:
+                index.add(obj_id, value_of(entry, index.attribute))
+        for index in self._built.values():
+            index.clear()
+        self._built = {}
+
+    def _estimate(self, condition: Tuple[str, str, Any]) -> Optional[int]:
+        """ Number of candidates an index returns for a condition
+        Return:
+          - None if no index can serve the condition
+        """
+        attribute, op, target = condition
+        try:
+            if op == "eq" and attribute in self.hashed:
+                return len(self.hashed[attribute]._ids.get(target, ()))
+            if attribute in self.ordered and target is not None:
+                index = self.sorted_index(attribute)
+                start, end = index.bounds(op, target)
+                return end - start + len(index._unordered)
+        except TypeError:
+            pass
+        return None
+
+    def _probe(self, obj_id: str, condition: Tuple[str, str, Any]) -> bool:
+        """ Check a candidate against an indexed condition, without
+        touching the object
+        """
+        attribute, op, target = condition
+        if op == "eq" and attribute in self.hashed:
+            index = self.hashed[attribute]
+            if obj_id not in index._values:
+                return True
+            return matches(index._values[obj_id], op, target)
+        index = self.sorted_index(attribute)
+        if obj_id in index._unordered:
+            return True
+        return matches(index.value(obj_id), op, target)
+
+    def candidates(self,
+                   conditions: List[Tuple[str, str, Any]]
+                   ) -> Optional[List[str]]:
+        """ Plan a query and return the IDs of the candidate objects
+        The most selective indexed condition drives the lookup, and its
+        candidates are filtered through the other indexed conditions
+        before any object is loaded.
+        Return:
+          - candidate IDs, or None if no condition is indexed
+        """
+        planned = []
+        for condition in conditions:
+            estimate = self._estimate(condition)
+            if estimate is not None:
+                planned.append((estimate, condition))
+        if not planned:
+            return None
+        planned.sort(key=lambda plan: plan[0])
+        attribute, op, target = planned[0][1]
+        if op == "eq" and attribute in self.hashed:
+            ids = self.hashed[attribute].lookup(target)
+        else:
+            ids = self.sorted_index(attribute).lookup(op, target)
+        for _, condition in planned[1:]:
+            ids = [i for i in ids if self._probe(i, condition)]
+        return ids
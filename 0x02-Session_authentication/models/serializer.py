@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+""" Serializer module
+Builds the specialized `to_json` and `from_json` functions of model
+classes from the attributes their instances are known to have.
+"""
+from datetime import datetime
+from typing import Any, Callable, Iterable, Optional, Sequence, Tuple
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+OPTIONAL, REQUIRED, TIMESTAMP = "optional", "required", "timestamp"
+
+
+def format_timestamp(value: datetime) -> str:
+    """ Format a datetime with TIMESTAMP_FORMAT
+    For naive datetimes from year 1000 on, `isoformat` gives the same
+    text faster than `strftime`.
+    """
+    if value.tzinfo is None and value.year >= 1000:
+        if value.microsecond:
+            return value.isoformat(timespec="seconds")
+        return value.isoformat()
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def _build(source: str, name: str, namespace: dict) -> Callable:
+    """ Compile the function `name` defined by `source`
+    """
+    exec(compile(source, "<{}>".format(name), "exec"), namespace)
+    return namespace[name]
+
+
+def compile_to_json(names: Sequence[str], slots: bool,
+                    fallback: Callable[[Any, bool, Any], dict],
+                    selected: Optional[Iterable[str]] = None
+                    ) -> Callable[[Any, bool, Any], dict]:
+    """ Specialized `to_json(obj, for_serialization, fields)` for objects
+    that have exactly the attributes `names`, in that order
+    Attributes are read from `__dict__`, or one by one with `slots`. Only
+    those in `selected`, when it is given, are read and formatted; the
+    function is then meant to be called with `fields` listing them. Any
+    other object goes through `fallback`, which must give the same result.
+    """
+    if selected is not None:
+        selected = set(selected)
+    fields = [(i, name) for i, name in enumerate(names)
+              if selected is None or name in selected]
+    call = "return fallback(self, for_serialization, fields)"
+    lines = ["def to_json(self, for_serialization=False, fields=None):"]
+    if slots:
+        lines.append("    if getattr(self, '__dict__', None):")
+        lines.append("        " + call)
+        if fields:
+            lines.append("    try:")
+            for i, name in fields:
+                lines.append("        v{} = self.{}".format(i, name))
+            lines.append("    except AttributeError:")
+            lines.append("        " + call)
+    else:
+        lines.append("    d = self.__dict__")
+        lines.append("    if tuple(d) != NAMES:")
+        lines.append("        " + call)
+        for i, name in fields:
+            lines.append("    v{} = d[{!r}]".format(i, name))
+    for i, _ in fields:
+        lines.append("    if type(v{0}) is datetime:".format(i))
+        lines.append("        v{0} = format_timestamp(v{0})".format(i))
+    every = ", ".join("{!r}: v{}".format(name, i) for i, name in fields)
+    public = ", ".join("{!r}: v{}".format(name, i)
+                       for i, name in fields if name[0] != "_")
+    lines.append("    if for_serialization:")
+    lines.append("        return {" + every + "}")
+    lines.append("    return {" + public + "}")
+    namespace = {"NAMES": tuple(names), "datetime": datetime,
+                 "format_timestamp": format_timestamp, "fallback": fallback}
+    return _build("\n".join(lines), "to_json", namespace)
+
+
+def compile_from_json(cls: type, fields: Sequence[Tuple[str, str]],
+                      parse_timestamp: Callable[[Any], datetime],
+                      fallback: Callable[[dict], Any],
+                      assign: Optional[Callable[[Any, str, Any], None]] = None
+                      ) -> Callable[[dict], Any]:
+    """ Specialized `from_json(obj_json)` setting the attributes of a new
+    `cls` object in the order of `fields`, (name, kind) pairs where kind is
+      - OPTIONAL: copied from the key of the same name, None if missing
+      - REQUIRED: copied from the key of the same name
+      - TIMESTAMP: parsed from the key of the same name
+    Dictionaries with no value for a REQUIRED or TIMESTAMP field go through
+    `fallback`, which builds objects the regular way. Attributes are set
+    with `assign(obj, name, value)` when it is given.
+    """
+    lines = ["def from_json(obj_json):", "    get = obj_json.get"]
+    for i, (name, kind) in enumerate(fields):
+        if kind != OPTIONAL:
+            lines.append("    v{} = get({!r})".format(i, name))
+            lines.append("    if v{} is None:".format(i))
+            lines.append("        return fallback(obj_json)")
+    lines.append("    obj = new(cls)")
+    for i, (name, kind) in enumerate(fields):
+        if kind == OPTIONAL:
+            value = "get({!r})".format(name)
+        elif kind == TIMESTAMP:
+            value = "parse_timestamp(v{})".format(i)
+        else:
+            value = "v{}".format(i)
+        if assign is None:
+            lines.append("    obj.{} = {}".format(name, value))
+        else:
+            lines.append("    assign(obj, {!r}, {})".format(name, value))
+    lines.append("    return obj")
+    namespace = {"cls": cls, "new": object.__new__, "assign": assign,
+                 "parse_timestamp": parse_timestamp, "fallback": fallback}
+    return _build("\n".join(lines), "from_json", namespace)
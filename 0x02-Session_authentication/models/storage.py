@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+""" Storage module
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import (Any, BinaryIO, Callable, Iterable, Iterator, List,
+                    Optional, Tuple)
+from os import path
+from models import codec
+from models.serializer import format_timestamp
+import argparse
+import glob
+import io
+import json
+import os
+import re
+import threading
+import zlib
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+CHUNK_SIZE = 64 * 1024
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SHARD = re.compile(r'\.db_(?P<s_class>\w+)\.(?P<index>\d+)-of-(?P<shards>\d+)'
+                    r'\.json$')
+_LOCKS = {}
+_LOCKS_LOCK = threading.Lock()
+_FILE_LOCKS = {}
+FORMATS = {}
+
+
+def register_format(name: str, magic: Optional[bytes],
+                    dump: Callable[[dict, BinaryIO], None],
+                    load: Callable[[BinaryIO], Iterator[Tuple[str, dict]]]):
+    """ Register a snapshot file format
+    `dump(objs_json, f)` writes serialized objects by ID to a binary file
+    and `load(f)` streams them back as (ID, serialized object) pairs.
+    Files are read with the format whose `magic` they start with; files
+    starting with no registered magic are read as "json".
+    """
+    FORMATS[name] = (magic, dump, load)
+
+
+def lock(s_class: str) -> threading.RLock:
+    """ Reentrant lock serializing the file writes of a class
+    """
+    with _LOCKS_LOCK:
+        return _LOCKS.setdefault(s_class, threading.RLock())
+
+
+@contextmanager
+def file_lock(s_class: str):
+    """ Exclusive lock of the files of a class, shared with other processes
+    through flock on .db_<class>.lock. It also holds `lock(s_class)` and
+    is reentrant within a thread. Without fcntl only threads are
+    serialized.
+    """
+    with lock(s_class):
+        held = _FILE_LOCKS.get(s_class)
+        if held is None:
+            f = open(".db_{}.lock".format(s_class), 'a')
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            held = _FILE_LOCKS[s_class] = [f, 0]
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if held[1] == 0:
+                del _FILE_LOCKS[s_class]
+                if fcntl is not None:
+                    fcntl.flock(held[0], fcntl.LOCK_UN)
+                held[0].close()
+
+
+def stamp(file_path: str) -> Optional[Tuple[int, int, int]]:
+    """ Cheap change marker of a file
+    Return:
+      - (modification time in ns, size, inode), or None if it is missing
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def snapshot_path(s_class: str) -> str:
+    """ Path of the snapshot file of a class
+    """
+    return ".db_{}.json".format(s_class)
+
+
+def journal_path(s_class: str) -> str:
+    """ Path of the journal file of a class
+    """
+    return ".db_{}.journal".format(s_class)
+
+
+def version_path(s_class: str) -> str:
+    """ Path of the file counting the writes to the files of a class
+    """
+    return ".db_{}.version".format(s_class)
+
+
+def read_version(s_class: str) -> int:
+    """ Number of writes made to the files of a class, 0 if unknown
+    """
+    try:
+        with open(version_path(s_class)) as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_version(s_class: str) -> int:
+    """ Count one more write to the files of a class
+    Callers hold the lock of the class files. The count is replaced
+    through a temporary file, so readers never see a partial one.
+    Return:
+      - the new count
+    """
+    version = read_version(s_class) + 1
+    file_path = version_path(s_class)
+    tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write(str(version))
+    os.replace(tmp_path, file_path)
+    return version
+
+
+def shard_path(s_class: str, index: int, shards: int) -> str:
+    """ Path of one of the `shards` shard files of a class
+    """
+    return ".db_{}.{}-of-{}.json".format(s_class, index, shards)
+
+
+def shard_of(obj_id: str, shards: int) -> int:
+    """ Index of the shard holding an object ID
+    """
+    return zlib.crc32(obj_id.encode()) % shards
+
+
+def shard_paths(s_class: str) -> List[Tuple[str, int]]:
+    """ Existing shard files of a class
+    Return:
+      - (path, shard count) pairs, sorted by path
+    """
+    found = []
+    for file_path in sorted(glob.glob(".db_{}.*-of-*.json".format(s_class))):
+        match = _SHARD.match(path.basename(file_path))
+        if match and match.group("s_class") == s_class:
+            found.append((file_path, int(match.group("shards"))))
+    return found
+
+
+def read_snapshot(s_class: str) -> dict:
+    """ Read the snapshot of a class
+    Return:
+      - dictionary of serialized objects by ID, empty if there is none
+    """
+    return dict(iter_snapshot(s_class))
+
+
+def iter_snapshot(s_class: str) -> Iterator[Tuple[str, dict]]:
+    """ Stream the (ID, serialized object) pairs of the snapshot of a class
+    """
+    return iter_file(snapshot_path(s_class))
+
+
+def iter_file(file_path: str) -> Iterator[Tuple[str, dict]]:
+    """ Stream the (ID, serialized object) pairs of a snapshot or shard
+    file, in whichever registered format it was written
+    """
+    if not path.exists(file_path):
+        return
+    with open(file_path, 'rb') as f:
+        head = f.read(16)
+        f.seek(0)
+        load = FORMATS["json"][2]
+        for magic, _, format_load in FORMATS.values():
+            if magic is not None and head.startswith(magic):
+                load = format_load
+        yield from load(f)
+
+
+def _json_default(value: Any) -> str:
+    """ Serialize the timestamps a binary snapshot was decoded with
+    """
+    if type(value) is datetime:
+        return format_timestamp(value)
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+def _dump_json(objs_json: dict, f: BinaryIO):
+    """ Write serialized objects by ID as JSON
+    """
+    f.write(json.dumps(objs_json, default=_json_default).encode())
+
+
+def _load_json(binary: BinaryIO) -> Iterator[Tuple[str, dict]]:
+    """ Stream the (ID, serialized object) pairs of a JSON snapshot
+    The file is read in CHUNK_SIZE chunks and decoded one object at a
+    time, so the whole JSON text is never held in memory. Every decoded
+    key goes through one memo, so that the objects share their key strings
+    as they do with `json.load`.
+    """
+    file_path = getattr(binary, "name", "snapshot")
+    keys = {}
+
+    def share_keys(pairs: List[Tuple[str, Any]]) -> dict:
+        """ Build a decoded object with the memo's copy of its keys
+        """
+        return {keys.setdefault(key, key): value for key, value in pairs}
+
+    decoder = json.JSONDecoder(object_pairs_hook=share_keys)
+    with io.TextIOWrapper(binary, encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def skip(expected: str = None) -> str:
+            """ Skip whitespace, check the next character and return it
+            """
+            nonlocal buf, pos, eof
+            while True:
+                pos = _WHITESPACE.match(buf, pos).end()
+                if pos < len(buf) or eof:
+                    break
+                chunk = f.read(CHUNK_SIZE)
+                buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+            char = buf[pos:pos + 1]
+            if expected is not None and (not char or char not in expected):
+                raise ValueError("{}: unexpected {!r} at offset {}".format(
+                    file_path, char, pos))
+            return char
+
+        def decode():
+            """ Decode the next JSON value, reading more as needed
+            """
+            nonlocal buf, pos, eof
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    if end < len(buf) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                chunk = f.read(CHUNK_SIZE)
+                buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+
+        skip("{")
+        pos += 1
+        if skip("}\"") == "}":
+            return
+        while True:
+            obj_id = decode()
+            skip(":")
+            pos += 1
+            skip()
+            yield obj_id, decode()
+            if skip(",}") == "}":
+                return
+            pos += 1
+            skip("\"")
+
+
+register_format("json", None, _dump_json, _load_json)
+register_format("binary", codec.MAGIC, codec.dump, codec.load)
+
+
+def write_snapshot(s_class: str, objs_json: dict, fmt: str = "json"):
+    """ Replace the snapshot of a class and clear its journal
+    The snapshot is written to a temporary file first, so a crash never
+    leaves a partially written snapshot behind.
+    """
+    _write_file(snapshot_path(s_class), objs_json, fmt)
+    if path.exists(journal_path(s_class)):
+        os.remove(journal_path(s_class))
+
+
+def _write_file(file_path: str, objs_json: dict, fmt: str = "json"):
+    """ Replace a snapshot or shard file through a temporary file
+    The temporary file is named after the process, so processes writing
+    the same file never share it.
+    """
+    dump = FORMATS[fmt][1]
+    tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        dump(objs_json, f)
+    os.replace(tmp_path, file_path)
+
+
+def read_shards(s_class: str, workers: Optional[int] = None) -> dict:
+    """ Read every shard file of a class with a pool of `workers` threads
+    Return:
+      - dictionary of serialized objects by ID, empty if there is none
+    """
+    files = [file_path for file_path, _ in shard_paths(s_class)]
+    objs_json = {}
+    if not files:
+        return objs_json
+    with ThreadPoolExecutor(workers) as pool:
+        for part in pool.map(lambda f: dict(iter_file(f)), files):
+            objs_json.update(part)
+    return objs_json
+
+
+def write_shard(s_class: str, index: int, shards: int, objs_json: dict,
+                fmt: str = "json"):
+    """ Replace one of the `shards` shard files of a class
+    """
+    _write_file(shard_path(s_class, index, shards), objs_json, fmt)
+
+
+def reshard(s_class: str, shards: int, fmt: str = "json") -> int:
+    """ Rewrite the stored objects of a class into `shards` shard files
+    of format `fmt`
+    Objects are read from every existing file of the class: snapshot,
+    journal and shards of any count, in any format. With 0 shards they are
+    written back as a single snapshot. The old files are only removed once
+    the new ones are written.
+    Return:
+      - number of objects
+    """
+    with file_lock(s_class):
+        old = [file_path for file_path, _ in shard_paths(s_class)]
+        objs_json = read_snapshot(s_class)
+        replay_journal(s_class, objs_json)
+        objs_json.update(read_shards(s_class))
+        if shards == 0:
+            write_snapshot(s_class, objs_json, fmt)
+        else:
+            parts = [{} for _ in range(shards)]
+            for obj_id, obj_json in objs_json.items():
+                parts[shard_of(obj_id, shards)][obj_id] = obj_json
+            for index, part in enumerate(parts):
+                write_shard(s_class, index, shards, part, fmt)
+            old += [snapshot_path(s_class), journal_path(s_class)]
+        new = {shard_path(s_class, i, shards) for i in range(shards)}
+        for file_path in old:
+            if file_path not in new and path.exists(file_path):
+                os.remove(file_path)
+        return len(objs_json)
+
+
+def append_journal(s_class: str,
+                   entries: Iterable[Tuple[str, str, dict]]) -> int:
+    """ Append mutations to the journal of a class
+    Each entry is an (operation, object ID, serialized object) tuple,
+    where operation is "save" or "remove".
+    Return:
+      - size of the journal file in bytes
+    """
+    lines = []
+    for op, obj_id, obj_json in entries:
+        entry = {"op": op, "id": obj_id}
+        if op == "save":
+            entry["obj"] = obj_json
+        lines.append(json.dumps(entry) + "\n")
+    with open(journal_path(s_class), 'a') as f:
+        f.write("".join(lines))
+        return f.tell()
+
+
+def replay_journal(s_class: str, objs_json: dict) -> int:
+    """ Apply the journal of a class on top of its snapshot
+    Replaying is idempotent, so a journal left behind by an interrupted
+    compaction is harmless. A truncated last line, from a crash during an
+    append, is ignored.
+    Return:
+      - offset of the end of the last entry applied
+    """
+    entries, offset = read_journal(s_class)
+    for entry in entries:
+        if entry["op"] == "save":
+            objs_json[entry["id"]] = entry["obj"]
+        else:
+            objs_json.pop(entry["id"], None)
+    return offset
+
+
+def read_journal(s_class: str, offset: int = 0) -> Tuple[List[dict], int]:
+    """ Read the journal entries of a class from byte `offset` on
+    Reading stops before a truncated line, which may still be being
+    appended.
+    Return:
+      - (entries, offset of the end of the last entry read)
+    """
+    entries = []
+    file_path = journal_path(s_class)
+    if not path.exists(file_path):
+        return entries, offset
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+            offset += len(line)
+    return entries, offset
+
+
+def main(argv: Optional[List[str]] = None):
+    """ Storage maintenance tool, run from the directory of the files:
+        python3 -m models.storage reshard User 16 [--format binary]
+        python3 -m models.storage convert User binary
+    """
+    parser = argparse.ArgumentParser(description="Manage model files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser(
+            "reshard", help="rewrite the files of a class into N shards")
+    command.add_argument("s_class", help="model class name, e.g. User")
+    command.add_argument("shards", type=int,
+                         help="number of shard files, 0 for a single file")
+    command.add_argument("--format", default="json", choices=FORMATS,
+                         help="format of the new files")
+    command = commands.add_parser(
+            "convert", help="rewrite the files of a class in a format")
+    command.add_argument("s_class", help="model class name, e.g. User")
+    command.add_argument("format", choices=FORMATS,
+                         help="format of the new files")
+    args = parser.parse_args(argv)
+    if args.command == "convert":
+        counts = {shards for _, shards in shard_paths(args.s_class)}
+        if len(counts) > 1:
+            parser.error("{} has shards of several counts, use reshard"
+                         .format(args.s_class))
+        args.shards = counts.pop() if counts else 0
+    if args.shards < 0:
+        parser.error("shards must be 0 or more")
+    count = reshard(args.s_class, args.shards, args.format)
+    print("{}: {} objects in {} shard(s), {}".format(
+        args.s_class, count, args.shards or 1, args.format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+""" Store module
+"""
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+import threading
+
+
+class ObjectStore():
+    """ Objects of one model class by ID
+    An entry is either an object or the raw serialized dictionary it was
+    loaded from; raw entries are turned into objects by `hydrate` the first
+    time they are accessed. Entries keep their insertion order.
+
+    Every operation holds `lock`, a reentrant lock callers can also hold
+    to make several operations atomic. Iterations work on a snapshot of
+    the entries taken under the lock, so concurrent changes never break
+    them.
+    """
+
+    def __init__(self, hydrate: Callable[[dict], Any]):
+        """ Initialize an empty store
+        """
+        self._hydrate = hydrate
+        self._items = {}
+        self.lock = threading.RLock()
+
+    def _object(self, obj_id: str, item: Any) -> Any:
+        """ Object of an entry, hydrating it if it is still raw
+        The hydrated object only replaces the entry if it is still stored.
+        """
+        if type(item) is not dict:
+            return item
+        with self.lock:
+            current = self._items.get(obj_id)
+            if current is None:
+                return self._hydrate(item)
+            if type(current) is dict:
+                current = self._hydrate(current)
+                self._items[obj_id] = current
+            return current
+
+    def __getitem__(self, obj_id: str) -> Any:
+        """ Object by ID
+        """
+        with self.lock:
+            return self._object(obj_id, self._items[obj_id])
+
+    def __setitem__(self, obj_id: str, obj: Any):
+        """ Add or replace an object
+        """
+        with self.lock:
+            self._items[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Remove an object
+        """
+        with self.lock:
+            del self._items[obj_id]
+
+    def __contains__(self, obj_id: str) -> bool:
+        """ Check if an ID is stored
+        """
+        with self.lock:
+            return obj_id in self._items
+
+    def __len__(self) -> int:
+        """ Number of stored objects
+        """
+        with self.lock:
+            return len(self._items)
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over the IDs
+        """
+        return iter(self.keys())
+
+    def get(self, obj_id: str, default: Any = None) -> Any:
+        """ Object by ID, or `default` if it isn't stored
+        """
+        with self.lock:
+            item = self._items.get(obj_id)
+            if item is None:
+                return default
+            return self._object(obj_id, item)
+
+    def get_many(self, obj_ids: Iterable[str]) -> List[Any]:
+        """ Objects of the given IDs that are stored, in the same order
+        """
+        with self.lock:
+            return [self._object(obj_id, self._items[obj_id])
+                    for obj_id in obj_ids if obj_id in self._items]
+
+    def keys(self) -> list:
+        """ IDs of the stored objects
+        """
+        with self.lock:
+            return list(self._items)
+
+    def values(self) -> Iterator[Any]:
+        """ Iterate over the objects, hydrating raw entries
+        """
+        for obj_id, item in self.raw_items():
+            yield self._object(obj_id, item)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """ Iterate over (ID, object) pairs, hydrating raw entries
+        """
+        for obj_id, item in self.raw_items():
+            yield obj_id, self._object(obj_id, item)
+
+    def raw_items(self, obj_ids: Iterable[str] = None
+                  ) -> Iterator[Tuple[str, Any]]:
+        """ Iterate over (ID, entry) pairs without hydrating anything
+        Entries are either objects or raw dictionaries. With `obj_ids`,
+        only the entries of those IDs that are stored are returned.
+        """
+        with self.lock:
+            if obj_ids is None:
+                return iter(list(self._items.items()))
+            items = self._items
+            return iter([(obj_id, items[obj_id]) for obj_id in obj_ids
+                         if obj_id in items])
+
+    def load(self, objs_json: dict, lazy: bool = False):
+        """ Replace the content of the store with serialized objects
+        With `lazy`, objects are only built when first accessed.
+        """
+        if not lazy:
+            for obj_id, obj_json in objs_json.items():
+                objs_json[obj_id] = self._hydrate(obj_json)
+        with self.lock:
+            self._items = objs_json
@@ -2,13 +2,19 @@
 """ User module
 """
 import hashlib
-from models.base import Base
+from models.base import Base, COMPACT
 
 
 class User(Base):
     """ User class
     """
 
+    if COMPACT:
+        __slots__ = ("email", "_password", "first_name", "last_name")
+
+    indexed = ("email",)
+    ordered = ("email",) + Base.ordered
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """